@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/4.1/ref/settings/
 
 from pathlib import Path
 import os
+from django.core.exceptions import ImproperlyConfigured
 from django.core.mail import send_mail
 from datetime import timedelta 
 
@@ -53,6 +54,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'users.middleware.OrganizationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -89,6 +91,45 @@ DATABASES = {
     }
 }
 
+# Cache
+# CACHE_BACKEND picks the cache shared by the workers:
+#   locmem    - per process, for development
+#   file      - shared by all processes on one node (CACHE_LOCATION is a directory)
+#   db        - shared through the database table CACHE_LOCATION (run createcachetable)
+#   redis     - shared across nodes (CACHE_LOCATION is e.g. redis://host:6379/0), needs redis
+#   memcached - shared across nodes (CACHE_LOCATION is e.g. host:11211), needs pymemcache
+# Bumping CACHE_VERSION retires every key written by an older deploy.
+# The file backend's add() and incr() read and then write, so they are not atomic
+# across processes: recomputation of hot keys is coalesced only within a process,
+# and the cache_stats counters can miss increments. Use db for atomic locks on one
+# node, or redis / memcached for atomic locks and exact counters.
+
+CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', ''),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', os.path.join(BASE_DIR, 'cache')),
+    'db': ('django.core.cache.backends.db.DatabaseCache', 'django_cache'),
+    'redis': ('django.core.cache.backends.redis.RedisCache', 'redis://127.0.0.1:6379/0'),
+    'memcached': ('django.core.cache.backends.memcached.PyMemcacheCache', '127.0.0.1:11211'),
+}
+try:
+    CACHE_BACKEND, CACHE_DEFAULT_LOCATION = CACHE_BACKENDS[os.environ.get('CACHE_BACKEND', 'locmem')]
+except KeyError:
+    raise ImproperlyConfigured(f"CACHE_BACKEND must be one of: {', '.join(CACHE_BACKENDS)}.")
+
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.environ.get('CACHE_LOCATION', CACHE_DEFAULT_LOCATION),
+        'KEY_PREFIX': os.environ.get('CACHE_KEY_PREFIX', 'user_management'),
+        'VERSION': int(os.environ.get('CACHE_VERSION', 1)),
+        'TIMEOUT': 300,
+    }
+}
+
+# Sessions are only local to a worker when the cache is; use
+# 'django.contrib.sessions.backends.cached_db' with a shared cache.
+SESSION_ENGINE = os.environ.get('SESSION_ENGINE', 'django.contrib.sessions.backends.db')
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 
@@ -126,7 +167,19 @@ STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static'), ]
 
 # Media Files Settings
 MEDIA_URL = 'media/'
-MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+MEDIA_ROOT = os.environ.get('MEDIA_ROOT', os.path.join(BASE_DIR, 'media'))  # point at shared storage when scaling out
+
+# Activity Log Settings
+ACTIVITY_LOG_BATCH_SIZE = 100
+ACTIVITY_LOG_FLUSH_INTERVAL = 5  # seconds
+# Also write the buffer once the response has been sent. Entries are then durable by
+# the end of each request, at the cost of one bulk insert per request that logged.
+ACTIVITY_LOG_FLUSH_ON_REQUEST_END = True
+ACTIVITY_LOG_RETENTION_DAYS = 90
+
+# Profile Image Upload Settings
+PROFILE_IMAGE_MAX_SIZE = 10 * 1024 * 1024  # 10 MB
+PROFILE_IMAGE_MAX_PIXELS = 40000000
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.1/ref/settings/#default-auto-field
@@ -144,6 +197,13 @@ AUTH_USER_MODEL = 'users.MyUser'
 LOGIN_URL = 'user_app:login'
 LOGIN_REDIRECT_URL = 'user_app:home'
 
+AUTHENTICATION_BACKENDS = ['users.backends.ProfileModelBackend']
+
+# Dotted path of a callable that decodes the submitted login password,
+# e.g. 'users.utils.decrypt_login_password' for AES-encrypted passwords.
+LOGIN_PASSWORD_DECODER = None
+LOGIN_ENCRYPTION_KEY = os.environ.get('LOGIN_ENCRYPTION_KEY', 'your-secret-key')
+
 
 
 
@@ -0,0 +1,97 @@
+import atexit
+import logging
+import threading
+from functools import partial
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, transaction
+
+from users.models import ActivityLog
+
+logger = logging.getLogger(__name__)
+
+
+class ActivityBuffer:
+    """
+    In-process buffer of activity log entries, written with one bulk_create once
+    batch_size entries are waiting or flush_interval seconds after the first one.
+    Entries that fail to write are kept for the next flush, up to max_entries.
+    """
+
+    def __init__(self, batch_size, flush_interval):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_entries = batch_size * 10
+        self.entries = []
+        self.lock = threading.Lock()
+        self.timer = None
+
+    def add(self, entry):
+        with self.lock:
+            self.entries.append(entry)
+            full = len(self.entries) >= self.batch_size
+            if not full:
+                self.schedule()
+        if full:
+            self.flush()
+
+    def schedule(self):
+        """ Start the flush timer if it is not running; called with the lock held """
+        if self.timer is None:
+            self.timer = threading.Timer(self.flush_interval, self.flush_from_timer)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def flush(self):
+        """ Write the waiting entries; database errors are logged, never raised """
+        with self.lock:
+            entries, self.entries = self.entries, []
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+        if not entries:
+            return 0
+        try:
+            ActivityLog.objects.bulk_create(entries, batch_size=self.batch_size)
+        except DatabaseError:
+            logger.exception('Could not write %d activity log entries', len(entries))
+            self.requeue(entries)
+            return 0
+        return len(entries)
+
+    def requeue(self, entries):
+        with self.lock:
+            room = max(self.max_entries - len(self.entries), 0)
+            if len(entries) > room:
+                logger.error('Dropping %d activity log entries', len(entries) - room)
+            self.entries[:0] = entries[:room]
+            if self.entries:
+                self.schedule()
+
+    def flush_from_timer(self):
+        try:
+            self.flush()
+        finally:
+            close_old_connections()
+
+
+activity_buffer = ActivityBuffer(settings.ACTIVITY_LOG_BATCH_SIZE, settings.ACTIVITY_LOG_FLUSH_INTERVAL)
+atexit.register(activity_buffer.flush)
+
+
+def log_activity(actor, action, target, organization_id=None):
+    """
+    Queue an activity log entry. It joins the buffer only when the current
+    transaction commits, so rolled back changes are never logged.
+    """
+    if actor is not None and not actor.is_authenticated:
+        actor = None
+    entry = ActivityLog(
+        actor_id=actor.pk if actor is not None else None,
+        actor=actor.get_username() if actor is not None else '',
+        action=action,
+        organization_id=organization_id,
+        target_id=getattr(target, 'pk', None),
+        target=str(target)[:255],
+    )
+    transaction.on_commit(partial(activity_buffer.add, entry))
@@ -1,14 +1,132 @@
 from django.contrib import admin
 
-from users.models import MyUser, Profile
+from users.cache import ADMIN_COUNT_TIMEOUT, get_or_compute, request_tenant, tenant_cache_key
+from users.models import ActivityLog, MyUser, Organization, Profile
+from users.paginators import EstimatedCountPaginator, estimate_row_count
+
+
+class CityListFilter(admin.SimpleListFilter):
+    """ City filter whose choices are cached per tenant instead of queried on every changelist page """
+    title = 'city'
+    parameter_name = 'city'
+    cache_timeout = 300
+
+    def lookups(self, request, model_admin):
+        return get_or_compute(
+            tenant_cache_key(request_tenant(request), 'admin:city_choices'),
+            lambda: self.get_choices(request),
+            self.cache_timeout,
+            'admin:city_choices',
+        )
+
+    def get_choices(self, request):
+        cities = (MyUser.objects.for_request(request)
+                  .order_by('city').values_list('city', flat=True).distinct())
+        return [(city, city) for city in cities if city]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(city=self.value())
+        return queryset
+
+
+class EstimatedCountAdmin(admin.ModelAdmin):
+    """
+    ModelAdmin whose changelist counts big tables from a cached per-tenant estimate:
+    planner statistics for superusers, a periodic exact count for a tenant.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_paginator(self, request, queryset, per_page, orphans=0, allow_empty_first_page=True):
+        return self.paginator(
+            queryset, per_page, orphans, allow_empty_first_page,
+            base_queryset=self.get_queryset(request),
+            estimate=lambda: self.estimate_count(request),
+        )
+
+    def estimate_count(self, request):
+        def compute():
+            if request.user.is_superuser:
+                estimate = estimate_row_count(self.model)
+                if estimate is not None:
+                    return estimate
+            return self.get_queryset(request).count()
+        return get_or_compute(
+            tenant_cache_key(request_tenant(request), f'admin:count:{self.model._meta.label_lower}'),
+            compute,
+            ADMIN_COUNT_TIMEOUT,
+            'admin:count',
+        )
 
 
 # Register your models here.
-class UserAdmin(admin.ModelAdmin):
-    list_display = ('first_name', 'last_name', 'email', 'city', 'user_type')
-    list_filter = ('city', 'user_type')
+class UserAdmin(EstimatedCountAdmin):
+    list_display = ('first_name', 'last_name', 'email', 'city', 'user_type', 'organization')
+    list_select_related = ('organization',)
+    list_filter = (CityListFilter, 'user_type')
     search_fields = ('first_name', 'last_name', 'username', 'city')
+    # Fields through which tenant staff could step outside their tenant.
+    superuser_fields = ('is_superuser', 'groups', 'user_permissions')
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).for_request(request)
+
+    def get_readonly_fields(self, request, obj=None):
+        readonly_fields = super().get_readonly_fields(request, obj)
+        if not request.user.is_superuser:
+            readonly_fields = (*readonly_fields, *self.superuser_fields)
+        return readonly_fields
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'organization' and not request.user.is_superuser:
+            organization = request.organization
+            kwargs['queryset'] = (Organization.objects.filter(pk=organization.pk)
+                                  if organization is not None else Organization.objects.none())
+            kwargs['required'] = True
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+
+class OrganizationAdmin(admin.ModelAdmin):
+    list_display = ('name', 'slug')
+    search_fields = ('name', 'slug')
+    prepopulated_fields = {'slug': ('name',)}
+
+
+class ProfileAdmin(EstimatedCountAdmin):
+    list_display = ('__str__', 'image')
+    list_select_related = ('user',)
+    autocomplete_fields = ('user',)
+    search_fields = ('user__username',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).for_request(request)
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'user':
+            kwargs['queryset'] = MyUser.objects.for_request(request)
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+
+class ActivityLogAdmin(EstimatedCountAdmin):
+    list_display = ('created_at', 'actor', 'action', 'target')
+    list_filter = ('action',)
+    date_hierarchy = 'created_at'
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).for_request(request)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
 
 
 admin.site.register(MyUser, UserAdmin)
-admin.site.register(Profile)
+admin.site.register(Profile, ProfileAdmin)
+admin.site.register(Organization, OrganizationAdmin)
+admin.site.register(ActivityLog, ActivityLogAdmin)
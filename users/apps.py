@@ -1,4 +1,5 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class UsersConfig(AppConfig):
@@ -6,4 +7,6 @@ class UsersConfig(AppConfig):
     name = 'users'
 
     def ready(self):
-        import users.signals
\ No newline at end of file
+        import users.signals
+        from users.utils import derive_key
+        derive_key(settings.LOGIN_ENCRYPTION_KEY)
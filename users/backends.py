@@ -0,0 +1,32 @@
+from django.contrib.auth.backends import ModelBackend
+
+from users.models import MyUser
+
+
+class ProfileModelBackend(ModelBackend):
+    """
+    Model backend that loads the user together with its profile in a single query,
+    both at login and when the session user is restored on later requests.
+    """
+
+    def get_queryset(self):
+        return MyUser._default_manager.select_related('profile')
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(MyUser.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        user = self.get_queryset().filter(**{MyUser.USERNAME_FIELD: username}).first()
+        if user is None:
+            # Run the default password hasher once to keep the response time the
+            # same whether or not the user exists.
+            MyUser().set_password(password)
+            return None
+        if user.check_password(password) and self.user_can_authenticate(user):
+            return user
+        return None
+
+    def get_user(self, user_id):
+        user = self.get_queryset().filter(pk=user_id).first()
+        return user if user is not None and self.user_can_authenticate(user) else None
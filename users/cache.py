@@ -0,0 +1,142 @@
+import atexit
+import math
+import random
+import threading
+import time
+from collections import Counter
+
+from django.core.cache import cache
+
+USER_COUNTS_TIMEOUT = 60
+USER_LIST_TIMEOUT = 60
+ORGANIZATION_TIMEOUT = 300
+ADMIN_COUNT_TIMEOUT = 300
+
+# Names reported by the cache_stats command.
+CACHE_STAT_NAMES = ('organization', 'user_counts', 'user_list', 'admin:city_choices', 'admin:count')
+
+# Values are kept this many seconds past their logical expiry so a stale copy
+# can be served while one worker recomputes it.
+STALE_GRACE = 60
+# Higher values make early recomputation more eager (XFetch beta).
+EARLY_EXPIRY_BETA = 1.0
+LOCK_TIMEOUT = 10
+LOCK_WAIT_INTERVAL = 0.05
+LOCK_WAIT_ATTEMPTS = 20
+
+
+def organization_cache_key(organization_id):
+    return f'organization:{organization_id}'
+
+
+def request_tenant(request):
+    """ Cache namespace of a request: 'all' for superusers, else the organization id or 'none' """
+    if request.user.is_superuser:
+        return 'all'
+    organization = request.organization
+    return organization.pk if organization is not None else 'none'
+
+
+def tenant_version_key(tenant):
+    return f'org:{tenant}:version'
+
+
+def tenant_cache_key(tenant, key):
+    """
+    Namespace a cache key by tenant so tenants never share or overwrite entries.
+    The key embeds the tenant's version, so bumping it invalidates every key at once.
+    """
+    version = cache.get_or_set(tenant_version_key(tenant), 1, None)
+    return f'org:{tenant}:v{version}:{key}'
+
+
+def invalidate_tenant_cache(*organization_ids):
+    """ Retire the cached entries of the given tenants and the unscoped ones """
+    tenants = {organization_id or 'none' for organization_id in organization_ids} | {'all'}
+    for key in map(tenant_version_key, tenants):
+        cache.add(key, 1, None)
+        cache.incr(key)
+
+
+class CacheStats:
+    """
+    Hit and miss counters, kept per process and added to shared counters in the
+    cache every flush_every lookups so the ratio covers all workers. The shared
+    counters are exact only where cache.incr() is atomic (redis, memcached).
+    """
+
+    def __init__(self, flush_every=100):
+        self.flush_every = flush_every
+        self.counts = Counter()
+        self.pending = 0
+        self.lock = threading.Lock()
+
+    def record(self, name, hit):
+        with self.lock:
+            self.counts[(name, 'hits' if hit else 'misses')] += 1
+            self.pending += 1
+            if self.pending < self.flush_every:
+                return
+            counts, self.counts, self.pending = self.counts, Counter(), 0
+        self.flush(counts)
+
+    def flush(self, counts=None):
+        if counts is None:
+            with self.lock:
+                counts, self.counts, self.pending = self.counts, Counter(), 0
+        for (name, kind), count in counts.items():
+            key = f'stats:{name}:{kind}'
+            cache.add(key, 0, None)
+            cache.incr(key, count)
+
+    def get(self, name):
+        """ Shared (hits, misses) of a name """
+        hits = cache.get(f'stats:{name}:hits', 0)
+        misses = cache.get(f'stats:{name}:misses', 0)
+        return hits, misses
+
+
+cache_stats = CacheStats()
+atexit.register(cache_stats.flush)
+
+
+def get_or_compute(key, compute, timeout, name):
+    """
+    Cached value of key, computed with compute() when missing.
+
+    Hot keys are protected from stampedes in two ways: a value is recomputed a little
+    before it expires, with a probability that grows as expiry nears and with how long
+    it took to compute, and only the worker holding the key's lock recomputes while
+    the others serve the stale copy or wait briefly for the new one.
+
+    The lock is a cache.add(), so it holds across processes only where add() is atomic
+    (db, redis, memcached). On the file backend it is best-effort: workers in one
+    process are coalesced, but separate processes may each recompute.
+    """
+    entry = cache.get(key)
+    if entry is not None:
+        value, duration, expires_at = entry
+        if time.time() - duration * EARLY_EXPIRY_BETA * math.log(1.0 - random.random()) < expires_at:
+            cache_stats.record(name, hit=True)
+            return value
+    cache_stats.record(name, hit=False)
+
+    lock_key = f'{key}:lock'
+    locked = cache.add(lock_key, 1, LOCK_TIMEOUT)
+    if not locked:
+        if entry is not None:
+            return entry[0]
+        for _ in range(LOCK_WAIT_ATTEMPTS):
+            time.sleep(LOCK_WAIT_INTERVAL)
+            entry = cache.get(key)
+            if entry is not None:
+                return entry[0]
+    try:
+        start = time.time()
+        value = compute()
+        now = time.time()
+        cache.set(key, (value, now - start, now + timeout), timeout + STALE_GRACE)
+    finally:
+        if locked:
+            cache.delete(lock_key)
+    return value
@@ -0,0 +1,40 @@
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.template.loader import get_template
+
+
+def render_email(subject_template_name, email_template_name, context, from_email, to_email,
+                 html_email_template_name=None):
+    """
+    Build one email message. Each template is rendered only once, so when the text
+    and html parts share a template the html alternative reuses the text body.
+    Compiled templates are reused through Django's cached template loader.
+    """
+    subject = get_template(subject_template_name).render(context)
+    subject = ''.join(subject.splitlines())
+    body = get_template(email_template_name).render(context)
+    email_message = EmailMultiAlternatives(subject, body, from_email, [to_email])
+    if html_email_template_name:
+        if html_email_template_name == email_template_name:
+            html_email = body
+        else:
+            html_email = get_template(html_email_template_name).render(context)
+        email_message.attach_alternative(html_email, 'text/html')
+    return email_message
+
+
+def render_emails(subject_template_name, email_template_name, contexts, from_email,
+                  html_email_template_name=None):
+    """ Render a batch of messages from (to_email, context) pairs """
+    return [
+        render_email(subject_template_name, email_template_name, context, from_email, to_email,
+                     html_email_template_name=html_email_template_name)
+        for to_email, context in contexts
+    ]
+
+
+def send_emails(email_messages, fail_silently=False):
+    """ Send a batch of messages over a single connection """
+    if not email_messages:
+        return 0
+    connection = get_connection(fail_silently=fail_silently)
+    return connection.send_messages(email_messages)
@@ -1,12 +1,12 @@
 from django import forms
-from django.contrib.auth.forms import PasswordResetForm, SetPasswordForm
+from django.contrib.auth.forms import AuthenticationForm, PasswordResetForm, SetPasswordForm
 from django.contrib.auth.tokens import default_token_generator
-from django.core.mail import EmailMultiAlternatives
-from django.template.loader import render_to_string
 from django.utils.encoding import force_bytes
 from django.utils.http import urlsafe_base64_encode
 from django.contrib.sites.shortcuts import get_current_site
-from users.models import MyUser, Profile
+from users.emails import render_emails, send_emails
+from users.models import MyUser, Organization, Profile
+from users.utils import get_login_password_decoder
 
 class CustomPasswordResetForm(PasswordResetForm):
     email = forms.EmailField(
@@ -21,16 +21,6 @@ class CustomPasswordResetForm(PasswordResetForm):
         })
     )
 
-    def send_mail(self, subject_template_name, email_template_name, context, from_email, to_email, html_email_template_name=None):
-        subject = render_to_string(subject_template_name, context)
-        subject = ''.join(subject.splitlines())
-        body = render_to_string(email_template_name, context)
-        email_message = EmailMultiAlternatives(subject, body, from_email, [to_email])
-        if html_email_template_name:
-            html_email = render_to_string(html_email_template_name, context)
-            email_message.attach_alternative(html_email, 'text/html')
-        email_message.send()
-
     def save(self, domain_override=None,
              subject_template_name='users/password_reset_subject.txt',
              email_template_name='users/password_reset_email.html',
@@ -39,9 +29,10 @@ class CustomPasswordResetForm(PasswordResetForm):
              extra_email_context=None):
         """
         Generate a one-use only link for resetting password and send it to the user.
+        All messages are rendered first and then sent over a single connection.
         """
         email = self.cleaned_data["email"]
-        email_field_name = MyUser.get_email_field_name()
+        contexts = []
         for user in self.get_users(email):
             if not domain_override:
                 current_site = get_current_site(request)
@@ -59,12 +50,42 @@ class CustomPasswordResetForm(PasswordResetForm):
                 'protocol': 'https' if use_https else 'http',
                 **(extra_email_context or {}),
             }
-            self.send_mail(
-                subject_template_name, email_template_name, context, from_email,
-                user.email, html_email_template_name=html_email_template_name,
+            contexts.append((user.email, context))
+        send_emails(render_emails(
+            subject_template_name, email_template_name, contexts, from_email,
+            html_email_template_name=html_email_template_name,
+        ))
+
+class CustomLoginForm(AuthenticationForm):
+    """ Login Form that decodes the password with LOGIN_PASSWORD_DECODER """
+    def clean_password(self):
+        password = self.cleaned_data['password']
+        decoder = get_login_password_decoder()
+        if decoder is None:
+            return password
+        try:
+            password = decoder(password)
+        except (ValueError, UnicodeDecodeError):
+            password = None
+        if not password:
+            raise self.get_invalid_login_error()
+        return password
+
+class OrganizationChoiceMixin:
+    """
+    Adds a required organization choice for superusers, who belong to no tenant.
+    Everyone else joins their own organization, so the field is removed for them.
+    """
+    def __init__(self, *args, user=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if user is not None and user.is_superuser:
+            self.fields['organization'] = forms.ModelChoiceField(
+                queryset=Organization.objects.order_by('name'),
+                label='Organization',
+                widget=forms.Select(attrs={'class': 'form-control'}),
             )
 
-class UserCreateForm(forms.ModelForm):
+class UserCreateForm(OrganizationChoiceMixin, forms.ModelForm):
     """ User Create or Registration Form """
     class Meta:
         model = MyUser
@@ -114,7 +135,7 @@ class CustomerProfileForm(forms.ModelForm):
             'image': forms.FileInput(attrs={'class': 'form-control'}),
         }
 
-class InviteUserForm(forms.Form):
+class InviteUserForm(OrganizationChoiceMixin, forms.Form):
     email = forms.EmailField(label='Email')
     USER_TYPE_CHOICES = [
         ('admin', 'Admin'),
@@ -0,0 +1,40 @@
+import os
+import tempfile
+import warnings
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files import File
+from PIL import Image, UnidentifiedImageError
+
+
+def sniff_image(header):
+    """
+    Identify an image from its leading bytes without decoding the pixel data.
+    Returns (format, (width, height)) or None if the header is not a readable image yet.
+    Raises Image.DecompressionBombError for images past Pillow's pixel limit.
+    """
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', Image.DecompressionBombWarning)
+            with Image.open(BytesIO(header)) as img:
+                return img.format, img.size
+    except (UnidentifiedImageError, OSError, SyntaxError):
+        return None
+
+
+def recompress_image(image, quality=70):
+    """
+    Re-encode an uploaded image as JPEG. The source is opened from its temp file path
+    when available so PIL can memory-map it, and the output is spooled to a temp file.
+    """
+    source = image.file
+    if hasattr(source, 'temporary_file_path'):
+        source = source.temporary_file_path()
+    output = tempfile.NamedTemporaryFile(suffix='.jpg', dir=settings.FILE_UPLOAD_TEMP_DIR)
+    with Image.open(source) as img:
+        if img.mode not in ('RGB', 'L'):
+            img = img.convert('RGB')
+        img.save(output, format='JPEG', quality=quality)
+    output.seek(0)
+    return File(output, name=f"{os.path.basename(image.name).split('.')[0]}.jpg")
@@ -0,0 +1,55 @@
+import time
+
+from django.contrib.auth.views import LoginView
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.test.utils import get_runner, override_settings, setup_test_environment, teardown_test_environment
+from django.urls import include, path
+from django.conf import settings
+
+urlpatterns = [
+    path('stock-login/', LoginView.as_view(template_name='users/login.html'), name='stock_login'),
+    path('', include('users.urls')),
+]
+
+
+class Command(BaseCommand):
+    help = 'Compare logins per second of the stock LoginView and the users login pipeline on a test database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50)
+        parser.add_argument(
+            '--fast-hasher', action='store_true',
+            help='Use the MD5 hasher so the timings show request overhead instead of password hashing.',
+        )
+
+    def handle(self, *args, **options):
+        overrides = {'ROOT_URLCONF': __name__}
+        if options['fast_hasher']:
+            overrides['PASSWORD_HASHERS'] = ['django.contrib.auth.hashers.MD5PasswordHasher']
+        setup_test_environment()
+        runner = get_runner(settings)(verbosity=0)
+        old_config = runner.setup_databases()
+        try:
+            with override_settings(**overrides):
+                from users.models import MyUser
+                MyUser.objects.create_user('benchmark', password='benchmark-password', user_type='customer')
+                for label, url, backends in (
+                    ('stock LoginView', '/stock-login/', ['django.contrib.auth.backends.ModelBackend']),
+                    ('CustomLoginView', '/login/', settings.AUTHENTICATION_BACKENDS),
+                ):
+                    with override_settings(AUTHENTICATION_BACKENDS=backends):
+                        rate = self.run_logins(url, options['requests'])
+                    self.stdout.write(f'{label}: {rate:.1f} logins/sec')
+        finally:
+            runner.teardown_databases(old_config)
+            teardown_test_environment()
+
+    def run_logins(self, url, count):
+        data = {'username': 'benchmark', 'password': 'benchmark-password'}
+        start = time.perf_counter()
+        for _ in range(count):
+            response = Client().post(url, data)
+            if response.status_code != 302:
+                raise RuntimeError(f'Login failed on {url} with status {response.status_code}')
+        return count / (time.perf_counter() - start)
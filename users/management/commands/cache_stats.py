@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from users.cache import CACHE_STAT_NAMES, cache_stats
+
+
+class Command(BaseCommand):
+    help = 'Show the shared hit ratio of the instrumented cache keys.'
+
+    def handle(self, *args, **options):
+        for name in CACHE_STAT_NAMES:
+            hits, misses = cache_stats.get(name)
+            total = hits + misses
+            ratio = f'{hits / total:.1%}' if total else 'n/a'
+            self.stdout.write(f'{name}: {hits} hits, {misses} misses, hit ratio {ratio}')
@@ -0,0 +1,27 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from users.models import ActivityLog
+
+
+class Command(BaseCommand):
+    help = 'Delete activity log entries older than the retention period, in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.ACTIVITY_LOG_RETENTION_DAYS)
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        old_entries = ActivityLog.objects.filter(created_at__lt=cutoff).order_by('created_at')
+        total = 0
+        while True:
+            pks = list(old_entries.values_list('pk', flat=True)[:options['batch_size']])
+            if not pks:
+                break
+            ActivityLog.objects.filter(pk__in=pks).delete()
+            total += len(pks)
+        self.stdout.write(f'Deleted {total} activity log entries older than {options["days"]} days.')
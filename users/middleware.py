@@ -0,0 +1,25 @@
+from users.cache import ORGANIZATION_TIMEOUT, get_or_compute, organization_cache_key
+from users.models import Organization
+
+
+def get_organization(user):
+    """ Tenant of the user, read from the cache; superusers are not scoped to a tenant """
+    if not user.is_authenticated or user.is_superuser or user.organization_id is None:
+        return None
+    return get_or_compute(
+        organization_cache_key(user.organization_id),
+        lambda: Organization.objects.filter(pk=user.organization_id).first(),
+        ORGANIZATION_TIMEOUT,
+        'organization',
+    )
+
+
+class OrganizationMiddleware:
+    """ Resolves the tenant once per request and sets it as request.organization """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.organization = get_organization(request.user)
+        return self.get_response(request)
@@ -0,0 +1,43 @@
+# Generated by Django 5.0.7 on 2026-10-19 19:42
+
+import django.db.models.deletion
+import users.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('users', '0003_alter_profile_image'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Organization',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('slug', models.SlugField(max_length=255, unique=True)),
+            ],
+        ),
+        migrations.AlterModelManagers(
+            name='myuser',
+            managers=[
+                ('objects', users.models.MyUserManager()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='myuser',
+            name='organization',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='users', to='users.organization'),
+        ),
+        migrations.AddIndex(
+            model_name='myuser',
+            index=models.Index(fields=['organization', 'user_type'], name='users_myuser_org_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='myuser',
+            index=models.Index(fields=['organization', 'username'], name='users_myuser_org_username_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+from django.db import migrations
+
+BATCH_SIZE = 1000
+
+
+def backfill_organization(apps, schema_editor):
+    """ Move existing users into a default organization, one primary key range at a time """
+    Organization = apps.get_model('users', 'Organization')
+    MyUser = apps.get_model('users', 'MyUser')
+    db_alias = schema_editor.connection.alias
+    users = MyUser.objects.using(db_alias).filter(organization__isnull=True)
+    if not users.exists():
+        return
+    organization, _ = Organization.objects.using(db_alias).get_or_create(slug='default', defaults={'name': 'Default'})
+    last_pk = 0
+    while True:
+        pks = list(users.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:BATCH_SIZE])
+        if not pks:
+            break
+        MyUser.objects.using(db_alias).filter(pk__in=pks).update(organization=organization)
+        last_pk = pks[-1]
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('users', '0004_organization'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_organization, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.0.7 on 2026-10-19 20:05
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_backfill_organization'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('actor_id', models.BigIntegerField(blank=True, null=True)),
+                ('actor', models.CharField(blank=True, max_length=150)),
+                ('action', models.CharField(choices=[('created', 'Created'), ('updated', 'Updated'), ('deleted', 'Deleted'), ('invited', 'Invited'), ('registered', 'Registered')], max_length=20)),
+                ('organization_id', models.BigIntegerField(blank=True, null=True)),
+                ('target_id', models.BigIntegerField(blank=True, null=True)),
+                ('target', models.CharField(max_length=255)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['organization_id', 'created_at'], name='users_activity_org_time_idx')],
+            },
+        ),
+    ]
@@ -1,32 +1,121 @@
-from io import BytesIO
-from django.contrib.auth.models import AbstractUser
-from django.core.files.uploadedfile import InMemoryUploadedFile
+from django.contrib.auth.models import AbstractUser, UserManager
 from django.db import models
-from PIL import Image
-import sys
+from django.utils import timezone
+
+from users.images import recompress_image
+
+
+class Organization(models.Model):
+    """ Tenant that owns a set of users """
+    name = models.CharField(max_length=255)
+    slug = models.SlugField(max_length=255, unique=True)
+
+    def __str__(self):
+        return self.name
+
+
+class TenantQuerySet(models.QuerySet):
+    """ QuerySet of rows that belong to a tenant through organization_field """
+    organization_field = 'organization'
+
+    def for_organization(self, organization):
+        """ Rows of one tenant; no organization matches no rows """
+        if organization is None:
+            return self.none()
+        return self.filter(**{self.organization_field: organization.pk})
+
+    def for_request(self, request):
+        """ Rows visible to the request's user; only superusers see every tenant """
+        if request.user.is_superuser:
+            return self
+        return self.for_organization(request.organization)
+
+
+class MyUserQuerySet(TenantQuerySet):
+    pass
+
+
+class MyUserManager(UserManager.from_queryset(MyUserQuerySet)):
+    pass
 
 
 class MyUser(AbstractUser):
     """ User Model with Abstract User"""
+    organization = models.ForeignKey(Organization, on_delete=models.PROTECT, related_name='users', null=True, blank=True)
     city = models.CharField(max_length=255)
     user_type = models.CharField(max_length=255, choices=(('admin', 'Admin'), ('customer', 'Customer')))
 
+    objects = MyUserManager()
+
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            models.Index(fields=['organization', 'user_type'], name='users_myuser_org_type_idx'),
+            models.Index(fields=['organization', 'username'], name='users_myuser_org_username_idx'),
+        ]
+
     def __str__(self):
         return self.username
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remembered so a move between organizations can invalidate the old tenant too.
+        instance._loaded_organization_id = instance.__dict__.get('organization_id')
+        return instance
+
+class ProfileQuerySet(TenantQuerySet):
+    organization_field = 'user__organization'
+
+
 class Profile(models.Model):
     """ Profile Model with Profile Image"""
     user = models.OneToOneField(MyUser, on_delete=models.CASCADE)
     image = models.ImageField(default='default.webp', upload_to='images/profile/', null=True, blank=True)
 
+    objects = ProfileQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.user.username}'s Profile"
 
     def save(self, *args, **kwargs):
-        if self.image and self.image.size > 1000000:
-            img = Image.open(self.image)
-            output = BytesIO()
-            img.save(output, format='JPEG', quality=70)
-            output.seek(0)
-            self.image = InMemoryUploadedFile(output, 'ImageField', f"{self.image.name.split('.')[0]}.jpg", 'image/jpeg', sys.getsizeof(self.image), None)
+        # Only fresh uploads are recompressed; stored images are left untouched.
+        if self.image and not self.image._committed and self.image.size > 1000000:
+            self.image = recompress_image(self.image)
+        super().save(*args, **kwargs)
+
+
+class ActivityLogQuerySet(TenantQuerySet):
+    organization_field = 'organization_id'
+
+
+class ActivityLog(models.Model):
+    """ Append-only record of who did what to which user; ids are kept without foreign keys """
+    ACTION_CHOICES = (
+        ('created', 'Created'),
+        ('updated', 'Updated'),
+        ('deleted', 'Deleted'),
+        ('invited', 'Invited'),
+        ('registered', 'Registered'),
+    )
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+    actor_id = models.BigIntegerField(null=True, blank=True)
+    actor = models.CharField(max_length=150, blank=True)
+    action = models.CharField(max_length=20, choices=ACTION_CHOICES)
+    organization_id = models.BigIntegerField(null=True, blank=True)
+    target_id = models.BigIntegerField(null=True, blank=True)
+    target = models.CharField(max_length=255)
+
+    objects = ActivityLogQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['organization_id', 'created_at'], name='users_activity_org_time_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.actor or 'anonymous'} {self.action} {self.target}"
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError('Activity log entries are append-only.')
         super().save(*args, **kwargs)
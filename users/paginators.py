@@ -0,0 +1,61 @@
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+ESTIMATED_COUNT_THRESHOLD = 10000
+
+
+def estimate_row_count(model, using='default'):
+    """
+    Cheap row count estimate for a whole table, or None when the backend has none.
+    PostgreSQL reads the planner statistics. SQLite spans the lowest to the highest
+    rowid, both read from the rowid b-tree, so rows pruned from the low end (e.g. by
+    prune_activity_log) are not counted; rows deleted in between still are.
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE relname = %s', [table])
+        elif connection.vendor == 'sqlite':
+            cursor.execute(f'SELECT MAX(rowid) - MIN(rowid) + 1 FROM {connection.ops.quote_name(table)}')
+        else:
+            return None
+        row = cursor.fetchone()
+    if not row or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator for big tables. A queryset with no filters beyond those of base_queryset
+    (e.g. the tenant filter) is counted with estimate() once that returns at least
+    ESTIMATED_COUNT_THRESHOLD; smaller or further filtered querysets get an exact count.
+    Without an estimate callable, unfiltered querysets use the table statistics.
+    """
+
+    def __init__(self, object_list, per_page, orphans=0, allow_empty_first_page=True,
+                 base_queryset=None, estimate=None):
+        super().__init__(object_list, per_page, orphans, allow_empty_first_page)
+        self.base_queryset = base_queryset
+        self.estimate = estimate
+
+    def is_unfiltered(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is None or query.distinct:
+            return False
+        if self.base_queryset is not None:
+            return query.where == self.base_queryset.query.where
+        return not query.where
+
+    @cached_property
+    def count(self):
+        if self.is_unfiltered():
+            if self.estimate is not None:
+                estimate = self.estimate()
+            else:
+                estimate = estimate_row_count(self.object_list.model, self.object_list.db)
+            if estimate is not None and estimate >= ESTIMATED_COUNT_THRESHOLD:
+                return estimate
+        return super().count
@@ -1,7 +1,13 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import request_finished
+from django.db import transaction
 from django.dispatch import receiver
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 
-from users.models import MyUser, Profile
+from users.activity import activity_buffer
+from users.cache import invalidate_tenant_cache, organization_cache_key
+from users.models import MyUser, Organization, Profile
 
 # Example signal handler without Tools.demo.mcast.sender
 @receiver(post_save, sender=MyUser)
@@ -12,3 +18,23 @@ def create_profile(instance, created, **kwargs):
 @receiver(post_save, sender=MyUser)
 def save_profile(instance, **kwargs):
     instance.profile.save()
+
+@receiver(post_save, sender=MyUser)
+@receiver(post_delete, sender=MyUser)
+def clear_tenant_cache(instance, update_fields=None, **kwargs):
+    # Logins only touch last_login, which no cached value depends on.
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    organization_ids = {instance.organization_id, getattr(instance, '_loaded_organization_id', instance.organization_id)}
+    instance._loaded_organization_id = instance.organization_id
+    transaction.on_commit(lambda: invalidate_tenant_cache(*organization_ids))
+
+@receiver(post_save, sender=Organization)
+@receiver(post_delete, sender=Organization)
+def clear_organization(instance, **kwargs):
+    cache.delete(organization_cache_key(instance.pk))
+
+@receiver(request_finished)
+def flush_activity_log(**kwargs):
+    if settings.ACTIVITY_LOG_FLUSH_ON_REQUEST_END:
+        activity_buffer.flush()
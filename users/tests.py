@@ -1,3 +1,578 @@
-from django.test import TestCase
+import base64
+import struct
+import threading
+import time
+import zlib
+from io import BytesIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import Permission
+from django.contrib.sessions.models import Session
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.uploadhandler import SkipFile
+from django.db import DatabaseError
+from django.test import Client, RequestFactory, TestCase, override_settings
+from Crypto.Cipher import AES
+from PIL import Image
+from rest_framework_simplejwt.tokens import AccessToken
+
+from users.activity import ActivityBuffer, activity_buffer, log_activity
+from users.backends import ProfileModelBackend
+from users.cache import get_or_compute, tenant_cache_key, tenant_version_key
+from users.forms import CustomPasswordResetForm
+from users.models import ActivityLog, MyUser, Organization, Profile
+from users.paginators import ESTIMATED_COUNT_THRESHOLD, EstimatedCountPaginator, estimate_row_count
+from users.uploadhandlers import ProfileImageUploadHandler
+from users.utils import EAX_NONCE, derive_key, get_login_password_decoder
+
+FAST_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+
+def png_header(width, height):
+    """ Leading bytes of a PNG of the given size, without real pixel data """
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+    ihdr = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', ihdr) + chunk(b'IDAT', b'\x00' * 16)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class PasswordResetEmailTests(TestCase):
+    """ Password reset and invite emails """
+
+    def setUp(self):
+        for username in ('alice', 'alice2'):
+            MyUser.objects.create_user(username, email='alice@example.com', password='pw', user_type='customer')
+
+    def test_one_message_per_user_with_shared_html_body(self):
+        form = CustomPasswordResetForm({'email': 'alice@example.com'})
+        self.assertTrue(form.is_valid())
+        form.save(
+            domain_override='example.com',
+            email_template_name='users/password_reset_email.html',
+            html_email_template_name='users/password_reset_email.html',
+        )
+        self.assertEqual(len(mail.outbox), 2)
+        for message in mail.outbox:
+            html, mimetype = message.alternatives[0]
+            self.assertEqual(mimetype, 'text/html')
+            self.assertEqual(html, message.body)
+            self.assertEqual(message.to, ['alice@example.com'])
+
+    def test_invite_email_is_rendered_from_templates(self):
+        admin = MyUser.objects.create_superuser('root', 'root@example.com', 'pw', user_type='admin')
+        organization = Organization.objects.create(name='A', slug='a')
+        self.client.force_login(admin)
+        self.client.post('/user/invite/', {
+            'email': 'bob@example.com', 'user_type': 'customer', 'organization': organization.pk,
+        })
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].subject, 'Invite to Register')
+        self.assertIn('/user/register/c/?token=', mail.outbox[0].body)
+
+
+@override_settings(PROFILE_IMAGE_MAX_SIZE=1024 * 1024, PROFILE_IMAGE_MAX_PIXELS=40000000)
+class ProfileImageUploadHandlerTests(TestCase):
+    """ Early rejection of profile image uploads """
+
+    def setUp(self):
+        self.request = RequestFactory().post('/')
+        self.handler = ProfileImageUploadHandler(self.request)
+
+    def start(self, content_length=None, content_type='image/png'):
+        self.handler.new_file('image', 'photo.png', content_type, content_length)
+
+    def assertRejected(self, message, data=None, **kwargs):
+        with self.assertRaises(SkipFile):
+            self.start(**kwargs)
+            self.handler.receive_data_chunk(data, 0)
+        self.assertEqual(self.request.upload_errors, {'image': message})
+        self.assertTrue(self.handler.file.closed)
+
+    def test_accepts_small_image(self):
+        for content_type in ('image/png', 'application/octet-stream'):
+            output = BytesIO()
+            Image.new('RGB', (10, 10)).save(output, 'PNG')
+            data = output.getvalue()
+            self.start(content_type=content_type)
+            self.handler.receive_data_chunk(data, 0)
+            uploaded = self.handler.file_complete(len(data))
+            self.assertEqual(uploaded.size, len(data))
+            self.assertEqual(self.handler.image_size, (10, 10))
+            self.assertEqual(self.request.upload_errors, {})
+            uploaded.close()
+
+    def test_rejects_oversize_declared_length(self):
+        self.assertRejected('Profile image is too large.', content_length=2 * 1024 * 1024)
+
+    def test_rejects_oversize_stream(self):
+        self.start()
+        with self.assertRaises(SkipFile):
+            self.handler.receive_data_chunk(b'\x00' * 1024, 1024 * 1024)
+        self.assertTrue(self.handler.file.closed)
+
+
+    def test_rejects_non_image_body(self):
+        self.start(content_type='image/png')
+        self.handler.receive_data_chunk(b'not an image', 0)
+        self.assertIsNone(self.handler.file_complete(12))
+        self.assertEqual(self.request.upload_errors, {'image': 'Profile image must be an image file.'})
+
+    def test_rejects_too_many_pixels(self):
+        self.assertRejected('Profile image dimensions are too large.', data=png_header(7000, 7000))
+
+    def test_rejects_decompression_bomb(self):
+        self.assertRejected('Profile image dimensions are too large.', data=png_header(20000, 20000))
+
+    def test_profile_view_reports_decompression_bomb(self):
+        user = MyUser.objects.create_user('bob', email='bob@example.com', user_type='customer')
+        self.client.force_login(user)
+        upload = BytesIO(png_header(20000, 20000))
+        upload.name = 'bomb.png'
+        response = self.client.post(f'/user/profile/{user.pk}/c/', {
+            'username': 'bob', 'email': 'bob@example.com', 'image': upload,
+        }, follow=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Profile image dimensions are too large.')
+        user.profile.refresh_from_db()
+        self.assertEqual(user.profile.image.name, 'default.webp')
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class TenantIsolationTests(TestCase):
+    """ Users of one organization never see or change another organization's rows """
+
+    def setUp(self):
+        cache.clear()
+        self.org_a = Organization.objects.create(name='A', slug='a')
+        self.org_b = Organization.objects.create(name='B', slug='b')
+        self.admin_a = MyUser.objects.create_user('admin_a', user_type='admin', organization=self.org_a)
+        self.customer_a = MyUser.objects.create_user('customer_a', user_type='customer', organization=self.org_a)
+        self.customer_b = MyUser.objects.create_user('customer_b', user_type='customer', organization=self.org_b)
+        ActivityLog.objects.create(action='created', target='customer_a', organization_id=self.org_a.pk)
+        ActivityLog.objects.create(action='created', target='customer_b', organization_id=self.org_b.pk)
+
+    def usernames(self, response):
+        return [user['username'] for user in response.context['data']]
+
+    def test_list_and_counts_are_scoped(self):
+        self.client.force_login(self.admin_a)
+        self.assertEqual(self.usernames(self.client.get('/user/list/a/')), ['admin_a', 'customer_a'])
+        response = self.client.get('/')
+        self.assertEqual((response.context['a_count'], response.context['c_count']), (1, 1))
+
+    def test_other_tenant_cannot_be_updated_or_deleted(self):
+        self.client.force_login(self.admin_a)
+        self.assertEqual(self.client.get(f'/user/update/{self.customer_b.pk}/a/').status_code, 404)
+        self.assertEqual(self.client.post(f'/user/delete/{self.customer_b.pk}/a/').status_code, 404)
+        self.assertTrue(MyUser.objects.filter(pk=self.customer_b.pk).exists())
+
+    def test_activity_export_is_scoped(self):
+        self.client.force_login(self.admin_a)
+        content = b''.join(self.client.get('/user/activity/export/a/').streaming_content).decode()
+        self.assertIn('customer_a', content)
+        self.assertNotIn('customer_b', content)
+
+    def test_admin_changelist_is_scoped(self):
+        self.admin_a.is_staff = True
+        self.admin_a.save()
+        self.admin_a.user_permissions.add(Permission.objects.get(codename='view_myuser'))
+        self.client.force_login(self.admin_a)
+        response = self.client.get('/admin-panel/users/myuser/')
+        self.assertEqual(
+            sorted(user.username for user in response.context['cl'].result_list),
+            ['admin_a', 'customer_a'],
+        )
+
+    def test_user_without_organization_sees_nothing(self):
+        orphan = MyUser.objects.create_user('orphan', user_type='admin')
+        self.client.force_login(orphan)
+        self.assertEqual(self.usernames(self.client.get('/user/list/a/')), [])
+        response = self.client.get('/')
+        self.assertEqual((response.context['a_count'], response.context['c_count']), (0, 0))
+        self.assertEqual(self.client.get(f'/user/update/{self.customer_a.pk}/a/').status_code, 404)
+        content = b''.join(self.client.get('/user/activity/export/a/').streaming_content).decode()
+        self.assertNotIn('customer_', content)
+
+    def test_superuser_sees_every_tenant(self):
+        root = MyUser.objects.create_superuser('root', 'root@example.com', 'pw', user_type='admin')
+        self.client.force_login(root)
+        self.assertEqual(
+            self.usernames(self.client.get('/user/list/a/')),
+            ['admin_a', 'customer_a', 'customer_b', 'root'],
+        )
+
+    def test_superuser_creates_and_invites_into_chosen_organization(self):
+        root = MyUser.objects.create_superuser('root', 'root@example.com', 'pw', user_type='admin')
+        self.client.force_login(root)
+        data = {'username': 'new', 'email': 'new@example.com', 'password': 'pw', 'city': 'X'}
+        response = self.client.post('/user/create/a/', data)
+        self.assertIn('organization', response.context['form'].errors)
+        self.assertFalse(MyUser.objects.filter(username='new').exists())
+        self.client.post('/user/create/a/', {**data, 'organization': self.org_b.pk})
+        self.assertEqual(MyUser.objects.get(username='new').organization, self.org_b)
+
+        response = self.client.post('/user/invite/', {'email': 'bob@example.com', 'user_type': 'customer'})
+        self.assertIn('organization', response.context['form'].errors)
+        self.assertEqual(len(mail.outbox), 0)
+        self.client.post('/user/invite/', {
+            'email': 'bob@example.com', 'user_type': 'customer', 'organization': self.org_b.pk,
+        })
+        token = mail.outbox[0].body.split('?token=')[1].split()[0]
+        self.assertEqual(AccessToken(token)['organization_id'], self.org_b.pk)
+
+    def test_tenant_admin_cannot_choose_organization(self):
+        self.client.force_login(self.admin_a)
+        self.assertNotIn('organization', self.client.get('/user/create/a/').context['form'].fields)
+        self.client.post('/user/create/a/', {
+            'username': 'new', 'email': 'new@example.com', 'password': 'pw', 'city': 'X',
+            'organization': self.org_b.pk,
+        })
+        self.assertEqual(MyUser.objects.get(username='new').organization, self.org_a)
+
+    def login_admin_staff(self, *codenames):
+        self.admin_a.is_staff = True
+        self.admin_a.save()
+        self.admin_a.user_permissions.add(*Permission.objects.filter(codename__in=codenames))
+        self.client.force_login(self.admin_a)
+
+    def test_admin_change_form_offers_only_own_organization(self):
+        self.login_admin_staff('change_myuser')
+        response = self.client.get(f'/admin-panel/users/myuser/{self.customer_a.pk}/change/')
+        self.assertEqual(list(response.context['adminform'].form.fields['organization'].queryset), [self.org_a])
+        self.assertNotContains(response, 'name="is_superuser"')
+
+    def test_admin_staff_cannot_move_tenant_or_become_superuser(self):
+        self.login_admin_staff('change_myuser')
+        response = self.client.post(f'/admin-panel/users/myuser/{self.admin_a.pk}/change/', {
+            'username': 'admin_a', 'password': self.admin_a.password, 'city': 'X', 'user_type': 'admin',
+            'date_joined_0': '2024-01-01', 'date_joined_1': '00:00:00', 'is_staff': 'on', 'is_active': 'on',
+            'organization': self.org_b.pk, 'is_superuser': 'on',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('organization', response.context['adminform'].form.errors)
+        response = self.client.post(f'/admin-panel/users/myuser/{self.admin_a.pk}/change/', {
+            'username': 'admin_a', 'password': self.admin_a.password, 'city': 'X', 'user_type': 'admin',
+            'date_joined_0': '2024-01-01', 'date_joined_1': '00:00:00', 'is_staff': 'on', 'is_active': 'on',
+            'organization': self.org_a.pk, 'is_superuser': 'on',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.admin_a.refresh_from_db()
+        self.assertEqual(self.admin_a.organization, self.org_a)
+        self.assertFalse(self.admin_a.is_superuser)
+        self.assertEqual(self.admin_a.user_permissions.count(), 1)
+
+    def test_admin_profile_cannot_point_at_other_tenant_user(self):
+        self.login_admin_staff('change_profile')
+        Profile.objects.filter(user=self.customer_b).delete()
+        profile = self.customer_a.profile
+        response = self.client.post(f'/admin-panel/users/profile/{profile.pk}/change/', {
+            'user': self.customer_b.pk,
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('user', response.context['adminform'].form.errors)
+        profile.refresh_from_db()
+        self.assertEqual(profile.user, self.customer_a)
+
+
+class AdminChangelistQueryBudgetTests(TestCase):
+    """ Admin changelists run a fixed number of queries whatever the table size """
+    urls = ('/admin-panel/users/myuser/', '/admin-panel/users/profile/')
+
+    def setUp(self):
+        cache.clear()
+        self.organization = Organization.objects.create(name='A', slug='a')
+        self.root = MyUser.objects.create_superuser('root', 'root@example.com', 'pw', user_type='admin')
+        self.staff = MyUser.objects.create_user(
+            'staff', is_staff=True, user_type='admin', organization=self.organization,
+        )
+        self.staff.user_permissions.add(
+            *Permission.objects.filter(codename__in=['view_myuser', 'view_profile'])
+        )
+
+    def add_users(self, count):
+        MyUser.objects.bulk_create([
+            MyUser(username=f'user{i}', city=f'city{i % 7}', user_type='customer', organization=self.organization)
+            for i in range(count)
+        ])
+        Profile.objects.bulk_create([Profile(user=user) for user in MyUser.objects.filter(profile__isnull=True)])
+
+    def assertChangelistQueries(self, user, num):
+        self.client.force_login(user)
+        for url in self.urls:
+            self.client.get(url)
+            with self.assertNumQueries(num):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_small_tables_count_exactly(self):
+        self.add_users(50)
+        # session, user, COUNT(*), page of results; staff add two permission queries
+        self.assertChangelistQueries(self.root, 4)
+        self.assertChangelistQueries(self.staff, 6)
+
+    def test_big_tables_use_estimate(self):
+        self.add_users(ESTIMATED_COUNT_THRESHOLD + 2000)
+        # the COUNT(*) is replaced by a cached estimate, also within a tenant
+        self.assertChangelistQueries(self.root, 3)
+        self.assertChangelistQueries(self.staff, 5)
+
+    def test_filtered_changelist_counts_exactly(self):
+        self.add_users(ESTIMATED_COUNT_THRESHOLD + 2000)
+        self.client.force_login(self.staff)
+        response = self.client.get('/admin-panel/users/myuser/?city=city1')
+        self.assertEqual(response.context['cl'].result_count, MyUser.objects.filter(city='city1').count())
+
+
+class EstimatedCountPaginatorTests(TestCase):
+
+    def setUp(self):
+        self.organization = Organization.objects.create(name='A', slug='a')
+        MyUser.objects.create(username='a', organization=self.organization, city='x')
+        MyUser.objects.create(username='b', organization=self.organization, city='y')
+        self.base = MyUser.objects.for_organization(self.organization)
+
+    def paginator(self, queryset):
+        return EstimatedCountPaginator(
+            queryset, 10, base_queryset=self.base, estimate=lambda: ESTIMATED_COUNT_THRESHOLD,
+        )
+
+    def test_base_queryset_uses_estimate(self):
+        self.assertEqual(self.paginator(self.base.order_by('id')).count, ESTIMATED_COUNT_THRESHOLD)
+
+    def test_further_filters_count_exactly(self):
+        self.assertEqual(self.paginator(self.base.filter(city='x').order_by('id')).count, 1)
+
+    def test_table_estimate_ignores_rows_pruned_from_the_low_end(self):
+        self.assertIsNone(estimate_row_count(ActivityLog))
+        ActivityLog.objects.bulk_create(ActivityLog(action='created', target=str(i)) for i in range(10))
+        self.assertEqual(estimate_row_count(ActivityLog), 10)
+        ActivityLog.objects.filter(pk__in=ActivityLog.objects.order_by('pk').values('pk')[:7]).delete()
+        self.assertEqual(estimate_row_count(ActivityLog), 3)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class LoginTests(TestCase):
+    """ Login backend, password decoder and JWT login endpoint """
+
+    def setUp(self):
+        self.user = MyUser.objects.create_user('eve', password='pw-12345', user_type='customer')
+        get_login_password_decoder.cache_clear()
+        self.addCleanup(get_login_password_decoder.cache_clear)
+
+    def test_backend_loads_profile_in_one_query(self):
+        with self.assertNumQueries(1):
+            user = ProfileModelBackend().authenticate(None, username='eve', password='pw-12345')
+            self.assertEqual(user.profile.user_id, user.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(ProfileModelBackend().get_user(self.user.pk).profile.user_id, self.user.pk)
+
+    def test_backend_rejects_bad_credentials(self):
+        backend = ProfileModelBackend()
+        self.assertIsNone(backend.authenticate(None, username='eve', password='wrong'))
+        self.assertIsNone(backend.authenticate(None, username='nobody', password='pw-12345'))
+
+    def test_session_login(self):
+        response = self.client.post('/login/', {'username': 'eve', 'password': 'pw-12345'})
+        self.assertRedirects(response, '/', fetch_redirect_response=False)
+        self.assertEqual(int(self.client.session['_auth_user_id']), self.user.pk)
+
+    def test_invalid_login_shows_error(self):
+        response = self.client.post('/login/', {'username': 'eve', 'password': 'wrong'})
+        self.assertContains(response, 'Please enter a correct username and password')
+
+    def test_api_client_gets_jwt_pair_without_csrf_or_session(self):
+        client = Client(enforce_csrf_checks=True)
+        for data, content_type in (
+            ('{"username": "eve", "password": "pw-12345"}', 'application/json'),
+            ('username=eve&password=pw-12345', 'application/x-www-form-urlencoded'),
+        ):
+            response = client.post('/api/token/', data, content_type=content_type)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(set(response.json()), {'access', 'refresh'})
+            self.assertEqual(AccessToken(response.json()['access'])['user_id'], str(self.user.pk))
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, client.cookies)
+        self.assertFalse(Session.objects.exists())
+
+    def test_api_login_rejects_bad_credentials(self):
+        client = Client(enforce_csrf_checks=True)
+        response = client.post('/api/token/', {'username': 'eve', 'password': 'wrong'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('__all__', response.json()['errors'])
+        response = client.post('/api/token/', '{"username":', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(client.get('/api/token/').status_code, 405)
+
+    @override_settings(LOGIN_PASSWORD_DECODER='users.utils.decrypt_login_password', LOGIN_ENCRYPTION_KEY='test-key')
+    def test_encrypted_password(self):
+        cipher = AES.new(derive_key('test-key'), AES.MODE_EAX, nonce=EAX_NONCE)
+        encrypted = base64.b64encode(cipher.encrypt(b'pw-12345')).decode()
+        response = self.client.post('/login/', {'username': 'eve', 'password': encrypted})
+        self.assertEqual(response.status_code, 302)
+
+    @override_settings(LOGIN_PASSWORD_DECODER='users.utils.decrypt_login_password', LOGIN_ENCRYPTION_KEY='test-key')
+    def test_undecodable_password_is_invalid_login(self):
+        response = self.client.post('/api/token/', {'username': 'eve', 'password': '!!'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ActivityBufferTests(TestCase):
+    """ Buffered activity log writes """
+
+    def setUp(self):
+        self.buffer = ActivityBuffer(batch_size=2, flush_interval=60)
+        self.addCleanup(self.buffer.flush)
+
+    def entry(self, target='bob'):
+        return ActivityLog(action='created', target=target)
+
+    def test_flushes_when_batch_is_full(self):
+        self.buffer.add(self.entry())
+        self.assertEqual(ActivityLog.objects.count(), 0)
+        self.assertIsNotNone(self.buffer.timer)
+        self.buffer.add(self.entry())
+        self.assertEqual(ActivityLog.objects.count(), 2)
+        self.assertIsNone(self.buffer.timer)
+
+    def test_database_error_is_logged_and_entries_requeued(self):
+        self.buffer.add(self.entry())
+        with mock.patch.object(ActivityLog.objects, 'bulk_create', side_effect=DatabaseError), \
+                self.assertLogs('users.activity', 'ERROR'):
+            self.buffer.add(self.entry())
+        self.assertEqual(len(self.buffer.entries), 2)
+        self.assertEqual(self.buffer.flush(), 2)
+        self.assertEqual(ActivityLog.objects.count(), 2)
+
+    def test_requeue_is_bounded(self):
+        with self.assertLogs('users.activity', 'ERROR'):
+            self.buffer.requeue([self.entry() for _ in range(self.buffer.max_entries + 5)])
+        self.assertEqual(len(self.buffer.entries), self.buffer.max_entries)
+
+    def test_entries_are_queued_on_commit(self):
+        user = MyUser.objects.create_user('bob', user_type='customer')
+        with self.captureOnCommitCallbacks() as callbacks:
+            log_activity(user, 'updated', user)
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(activity_buffer.entries, [])
+
+    def test_flushes_at_request_end(self):
+        activity_buffer.add(self.entry('from-request'))
+        self.addCleanup(activity_buffer.flush)
+        self.client.get('/login/')
+        self.assertTrue(ActivityLog.objects.filter(target='from-request').exists())
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class TenantCacheInvalidationTests(TestCase):
+    """ Tenant cache versions move only when cached data can change """
+
+    def setUp(self):
+        cache.clear()
+        self.org_a = Organization.objects.create(name='A', slug='a')
+        self.org_b = Organization.objects.create(name='B', slug='b')
+        self.user = MyUser.objects.create_user('bob', password='pw', user_type='customer', organization=self.org_a)
+        self.user = MyUser.objects.get(pk=self.user.pk)
+
+    def versions(self):
+        return [cache.get(tenant_version_key(tenant)) for tenant in (self.org_a.pk, self.org_b.pk, 'all')]
+
+    def test_login_keeps_cache_warm(self):
+        tenant_cache_key(self.org_a.pk, 'user_counts')
+        before = self.versions()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/login/', {'username': 'bob', 'password': 'pw'})
+        self.assertEqual(self.versions(), before)
+
+    def test_invalidation_waits_for_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.user.city = 'Lahore'
+            self.user.save()
+        self.assertEqual(self.versions(), [None, None, None])
+        callbacks[-1]()
+        self.assertEqual(self.versions(), [2, None, 2])
+
+    def test_move_between_organizations_invalidates_both(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.organization = self.org_b
+            self.user.save()
+        self.assertEqual(self.versions(), [2, 2, 2])
+
+
+class StampedeProtectionTests(TestCase):
+    """ Concurrent callers of a hot key share one computation """
+    count = 20
+
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+        self.release = threading.Event()
+        self.lock_misses = threading.Semaphore(0)
+
+    def slow_compute(self):
+        self.calls += 1
+        # Held until every other caller has failed to take the lock.
+        self.assertTrue(self.release.wait(5))
+        return 42
+
+    def add(self, *args, **kwargs):
+        added = cache.add(*args, **kwargs)
+        if not added:
+            self.lock_misses.release()
+        return added
+
+    def call_concurrently(self, key):
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(get_or_compute(key, self.slow_compute, 60, 'test')))
+            for _ in range(self.count)
+        ]
+        with mock.patch('users.cache.cache', wraps=cache) as shared_cache, \
+                mock.patch('users.cache.LOCK_WAIT_ATTEMPTS', 1000):
+            shared_cache.add.side_effect = self.add
+            for thread in threads:
+                thread.start()
+            for _ in range(self.count - 1):
+                self.assertTrue(self.lock_misses.acquire(timeout=5))
+            self.release.set()
+            for thread in threads:
+                thread.join()
+        return results
+
+    def test_cold_key_is_computed_once(self):
+        self.assertEqual(self.call_concurrently('hot'), [42] * self.count)
+        self.assertEqual(self.calls, 1)
+
+    def test_expired_key_serves_stale_value_while_one_caller_recomputes(self):
+        cache.set('hot', ('stale', 0.2, time.time() - 1), 60)
+        results = self.call_concurrently('hot')
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(results.count(42), 1)
+        self.assertEqual(results.count('stale'), self.count - 1)
+
+
+class UserListCacheTests(TestCase):
+    """ The user list is paginated and cached one page at a time """
+
+    def setUp(self):
+        cache.clear()
+        self.organization = Organization.objects.create(name='A', slug='a')
+        self.admin = MyUser.objects.create_user('admin', user_type='admin', organization=self.organization)
+        MyUser.objects.bulk_create([
+            MyUser(username=f'user{i:02}', user_type='customer', organization=self.organization) for i in range(30)
+        ])
+        self.client.force_login(self.admin)
+
+    def test_pages_are_bounded(self):
+        first = self.client.get('/user/list/a/')
+        self.assertEqual(len(first.context['data']), 25)
+        self.assertEqual(first.context['paginator'].count, 31)
+        second = self.client.get('/user/list/a/?page=2')
+        self.assertEqual([user['username'] for user in second.context['data']], [f'user{i:02}' for i in range(24, 30)])
+        self.assertContains(second, '<td>26</td>', html=True)
+
+    def test_cached_page_needs_no_list_queries(self):
+        self.client.get('/user/list/a/')
+        # session and user only
+        with self.assertNumQueries(2):
+            self.client.get('/user/list/a/')
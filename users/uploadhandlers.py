@@ -0,0 +1,63 @@
+from django.conf import settings
+from django.core.files.uploadhandler import SkipFile, TemporaryFileUploadHandler
+from PIL import Image
+
+from users.images import sniff_image
+
+PROFILE_IMAGE_SNIFF_SIZE = 256 * 1024
+
+
+class ProfileImageUploadHandler(TemporaryFileUploadHandler):
+    """
+    Streams profile images to a temp file chunk by chunk. Uploads that are too large,
+    are not images or have too many pixels are skipped as soon as that is known, and
+    the reason is left on request.upload_errors for the view. Whether the upload is an
+    image is decided from its header bytes, not from the client's content type.
+    """
+    chunk_size = 64 * 1024
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        if request is not None:
+            request.upload_errors = {}
+
+    def record_error(self, message):
+        if self.request is not None:
+            self.request.upload_errors[self.field_name] = message
+
+    def reject(self, message):
+        self.record_error(message)
+        self.file.close()
+        raise SkipFile(message)
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        self.header = b''
+        self.image_size = None
+        if content_length and content_length > settings.PROFILE_IMAGE_MAX_SIZE:
+            self.reject('Profile image is too large.')
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > settings.PROFILE_IMAGE_MAX_SIZE:
+            self.reject('Profile image is too large.')
+        if self.image_size is None:
+            self.header += raw_data
+            try:
+                sniffed = sniff_image(self.header)
+            except Image.DecompressionBombError:
+                self.reject('Profile image dimensions are too large.')
+            if sniffed is not None:
+                self.image_size = sniffed[1]
+                self.header = b''
+                if self.image_size[0] * self.image_size[1] > settings.PROFILE_IMAGE_MAX_PIXELS:
+                    self.reject('Profile image dimensions are too large.')
+            elif len(self.header) >= PROFILE_IMAGE_SNIFF_SIZE:
+                self.reject('Profile image must be an image file.')
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        if self.image_size is None:
+            self.record_error('Profile image must be an image file.')
+            self.file.close()
+            return None
+        return super().file_complete(file_size)
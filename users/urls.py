@@ -12,7 +12,7 @@ from .views import (
     UserProfile,
     InviteUserView,  # Make sure to import InviteUserView if it's used
 )
-from django.contrib.auth.views import LoginView, LogoutView
+from django.contrib.auth.views import LogoutView
 from .views import CustomPasswordResetView, CustomPasswordResetConfirmView
 
 
@@ -24,8 +24,10 @@ urlpatterns = [
     path('user/create/a/', views.UserCreateView.as_view(), name='create'),
     path('user/update/<int:pk>/a/', views.UserUpdateView.as_view(), name='update'),
     path('user/delete/<int:pk>/a/', views.UserDeleteView.as_view(), name='delete'),
+    path('user/activity/export/a/', views.ActivityLogExportView.as_view(), name='activity_export'),
      path('user/register/c/', UserRegistrationView.as_view(), name='register'),
-    path('login/', LoginView.as_view(template_name='users/login.html'), name='login'),
+    path('login/', views.CustomLoginView.as_view(), name='login'),
+    path('api/token/', views.TokenLoginView.as_view(), name='token_login'),
     path('user/profile/<int:pk>/c/', views.UserProfile.as_view(), name='profile'),
     path('logout/', auth_views.LogoutView.as_view(next_page='user_app:home'), name='logout'),
 
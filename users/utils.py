@@ -1,24 +1,48 @@
+from functools import lru_cache
+
+from django.conf import settings
+from django.utils.module_loading import import_string
 from rest_framework_simplejwt.tokens import RefreshToken
 from users.models import MyUser
 import uuid
 from Crypto.Cipher import AES
 import base64
 
+EAX_NONCE = b'0' * 16
+
 
-def generate_invite_token(email, user_type):
+def generate_invite_token(email, user_type, organization_id=None):
     # Create a temporary user instance with a unique identifier
     temp_user = MyUser(email=email, username=str(uuid.uuid4()))
     refresh = RefreshToken.for_user(temp_user)
     refresh['email'] = email
     refresh['user_type'] = user_type
+    refresh['organization_id'] = organization_id
     return str(refresh.access_token)
 
-def decrypt_password(encrypted_password, secret_key):
-    key_bytes = bytes(secret_key, 'utf-8')
-    while len(key_bytes) < 32:
-        key_bytes += b' '  # Pad key to 32 bytes
+@lru_cache(maxsize=None)
+def derive_key(secret_key):
+    """ AES key for a secret, space padded to 32 bytes; derived once per secret """
+    return bytes(secret_key, 'utf-8').ljust(32, b' ')
 
-    cipher = AES.new(key_bytes, AES.MODE_EAX, nonce=b'0'*16)
+def decrypt_password(encrypted_password, secret_key):
+    # EAX ciphers are stateful, so only the derived key is reused between calls.
+    cipher = AES.new(derive_key(secret_key), AES.MODE_EAX, nonce=EAX_NONCE)
     decrypted_password = cipher.decrypt(base64.b64decode(encrypted_password))
 
     return decrypted_password.decode('utf-8')
+
+def decrypt_login_password(encrypted_password):
+    """ Login password decoder for clients that AES-encrypt the password field """
+    return decrypt_password(encrypted_password, settings.LOGIN_ENCRYPTION_KEY)
+
+@lru_cache(maxsize=None)
+def get_login_password_decoder():
+    """ Decoder named by settings.LOGIN_PASSWORD_DECODER, or None for plain passwords """
+    decoder = settings.LOGIN_PASSWORD_DECODER
+    return import_string(decoder) if decoder else None
+
+def get_tokens_for_user(user):
+    """ JWT pair for API clients """
+    refresh = RefreshToken.for_user(user)
+    return {'refresh': str(refresh), 'access': str(refresh.access_token)}
@@ -1,22 +1,31 @@
+import csv
+import json
+
 from django.shortcuts import render, redirect, get_object_or_404
+from django.http import JsonResponse, StreamingHttpResponse
 from django.urls import reverse_lazy, reverse
-from django.views.generic import ListView, CreateView, UpdateView, DeleteView, FormView
+from django.views.generic import ListView, CreateView, UpdateView, DeleteView, FormView, View
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q
 from django.utils.decorators import method_decorator
-from django.views.decorators.csrf import csrf_protect
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
 from django.utils.safestring import mark_safe
-from django.core.mail import send_mail
 from django.contrib.auth.forms import SetPasswordForm  # Import this line
 
-from users.models import MyUser
-from users.forms import UserCreateForm, UserUpdateForm, CustomerUpdateForm, CustomerProfileForm, CustomPasswordResetForm, InviteUserForm
-from django.contrib.auth.views import PasswordResetView, LogoutView, PasswordResetConfirmView
+from users.models import ActivityLog, MyUser
+from users.forms import UserCreateForm, UserUpdateForm, CustomerUpdateForm, CustomerProfileForm, CustomPasswordResetForm, InviteUserForm, CustomLoginForm
+from django.contrib.auth.views import PasswordResetView, LoginView, LogoutView, PasswordResetConfirmView
 from rest_framework_simplejwt.tokens import AccessToken
 from rest_framework_simplejwt.exceptions import TokenError
-from .utils import generate_invite_token, decrypt_password
+from .activity import log_activity
+from .cache import USER_COUNTS_TIMEOUT, USER_LIST_TIMEOUT, get_or_compute, request_tenant, tenant_cache_key
+from .emails import render_email
+from .uploadhandlers import ProfileImageUploadHandler
+from .utils import generate_invite_token, get_tokens_for_user
 from rest_framework.exceptions import AuthenticationFailed
 from rest_framework_simplejwt.tokens import UntypedToken
 
@@ -29,22 +38,27 @@ class InviteUserView(MyMixin, FormView):
     form_class = InviteUserForm
     template_name = 'users/invite.html'
 
+    def get_form_kwargs(self):
+        return {**super().get_form_kwargs(), 'user': self.request.user}
+
     def form_valid(self, form):
         email = form.cleaned_data['email']
         user_type = form.cleaned_data['user_type']
         
         # Generate token and registration link
-        token = generate_invite_token(email, user_type)
+        organization = form.cleaned_data.get('organization', self.request.organization)
+        token = generate_invite_token(email, user_type, organization.pk if organization else None)
         register_url = self.request.build_absolute_uri(reverse('user_app:register')) + f'?token={token}'
         
         # Send invitation email
-        send_mail(
-            'Invite to Register',
-            f'Please register using the following link: {register_url}',
+        render_email(
+            'users/invite_subject.txt',
+            'users/invite_email.txt',
+            {'register_url': register_url, 'user_type': user_type},
             settings.DEFAULT_FROM_EMAIL,
-            [email],
-            fail_silently=False,
-        )
+            email,
+        ).send(fail_silently=False)
+        log_activity(self.request.user, 'invited', email, organization.pk if organization else None)
         
         messages.success(self.request, f'Invitation sent to {email}.')
         return redirect(reverse('user_app:invite'))
@@ -59,6 +73,35 @@ class CustomPasswordResetConfirmView(PasswordResetConfirmView):
         messages.success(self.request, 'Your password has been changed successfully. Please log in.')
         return super().form_valid(form)
 
+class CustomLoginView(LoginView):
+    """ Session login through CustomLoginForm and the configured backends """
+    form_class = CustomLoginForm
+    template_name = 'users/login.html'
+
+@method_decorator(csrf_exempt, name='dispatch')
+class TokenLoginView(View):
+    """
+    JWT login for API clients. It takes a JSON or form-encoded body, checks it with
+    CustomLoginForm and answers with a JWT pair in one round trip. No session is
+    created, so there is no CSRF token to fetch first and no cookie to carry.
+    """
+    http_method_names = ['post']
+
+    def post(self, request, *args, **kwargs):
+        if request.content_type == 'application/json':
+            try:
+                data = json.loads(request.body)
+            except ValueError:
+                return JsonResponse({'errors': {'__all__': ['Malformed JSON body.']}}, status=400)
+            if not isinstance(data, dict):
+                return JsonResponse({'errors': {'__all__': ['Expected a JSON object.']}}, status=400)
+        else:
+            data = request.POST
+        form = CustomLoginForm(request, data=data)
+        if not form.is_valid():
+            return JsonResponse({'errors': form.errors}, status=400)
+        return JsonResponse(get_tokens_for_user(form.get_user()))
+
 class CustomLogoutView(LogoutView):
     def get_next_page(self):
         return reverse_lazy('user_app:home')
@@ -74,12 +117,15 @@ class CustomPasswordResetView(PasswordResetView):
 @login_required
 def home(request):
     """ Home Page """
-    admin_count = MyUser.objects.filter(user_type='admin').count()
-    customer_count = MyUser.objects.filter(user_type='customer').count()
-    context = {
-        'a_count': admin_count,
-        'c_count': customer_count,
-    }
+    context = get_or_compute(
+        tenant_cache_key(request_tenant(request), 'user_counts'),
+        lambda: MyUser.objects.for_request(request).aggregate(
+            a_count=Count('id', filter=Q(user_type='admin')),
+            c_count=Count('id', filter=Q(user_type='customer')),
+        ),
+        USER_COUNTS_TIMEOUT,
+        'user_counts',
+    )
     return render(request, 'users/home.html', context)
 
 class UserRegistrationView(CreateView):
@@ -93,12 +139,14 @@ class UserRegistrationView(CreateView):
         token = request.GET.get('token')
         self.email_from_token = None
         self.user_type = None
+        self.organization_id = None
 
         if token:
             try:
                 decoded_token = AccessToken(token)
                 self.email_from_token = decoded_token.get('email')
                 self.user_type = decoded_token.get('user_type')
+                self.organization_id = decoded_token.get('organization_id')
             except TokenError:
                 messages.error(request, 'The registration link is invalid or has expired.')
                 return redirect(reverse_lazy('user_app:invite'))
@@ -119,15 +167,46 @@ class UserRegistrationView(CreateView):
         password = form.cleaned_data['password']
         user.set_password(password)
         user.user_type = self.user_type
+        user.organization_id = self.organization_id
         user.save()
+        log_activity(user, 'registered', user, user.organization_id)
         
         messages.success(self.request, f"{user.username} is created successfully!")
         return redirect(self.success_url)
 
-class UserListView(MyMixin, ListView):
+class TenantMixin:
+    """Mixin that scopes the view's users to the request's organization."""
+    def get_queryset(self):
+        return MyUser.objects.for_request(self.request)
+
+class UserListView(MyMixin, TenantMixin, ListView):
     model = MyUser
     template_name = 'users/list.html'
     context_object_name = 'data'
+    fields = ('id', 'first_name', 'last_name', 'username', 'email', 'city', 'user_type')
+    paginate_by = 25
+
+    def get_queryset(self):
+        return super().get_queryset().order_by('id').values(*self.fields)
+
+    def cache_key(self, key):
+        return tenant_cache_key(request_tenant(self.request), f'user_list:{key}')
+
+    def get_paginator(self, queryset, per_page, orphans=0, allow_empty_first_page=True, **kwargs):
+        paginator = super().get_paginator(queryset, per_page, orphans, allow_empty_first_page, **kwargs)
+        paginator.count = get_or_compute(self.cache_key('count'), queryset.count, USER_LIST_TIMEOUT, 'user_list')
+        return paginator
+
+    def paginate_queryset(self, queryset, page_size):
+        # Only the count and single pages are cached, so entries stay small at any tenant size.
+        paginator, page, object_list, is_paginated = super().paginate_queryset(queryset, page_size)
+        page.object_list = get_or_compute(
+            self.cache_key(f'page:{page_size}:{page.number}'),
+            lambda: list(object_list),
+            USER_LIST_TIMEOUT,
+            'user_list',
+        )
+        return paginator, page, page.object_list, is_paginated
 
 class UserCreateView(MyMixin, CreateView):
     model = MyUser
@@ -135,15 +214,20 @@ class UserCreateView(MyMixin, CreateView):
     template_name = 'users/create.html'
     success_url = reverse_lazy('user_app:list')
 
+    def get_form_kwargs(self):
+        return {**super().get_form_kwargs(), 'user': self.request.user}
+
     def form_valid(self, form):
         user = form.save(commit=False)
         password = form.cleaned_data['password']
         user.set_password(password)
+        user.organization = form.cleaned_data.get('organization', self.request.organization)
         messages.success(self.request, f"{user.username} is created successfully!")
         user.save()
+        log_activity(self.request.user, 'created', user, user.organization_id)
         return redirect(reverse_lazy('user_app:list'))
 
-class UserUpdateView(MyMixin, UpdateView):
+class UserUpdateView(MyMixin, TenantMixin, UpdateView):
     model = MyUser
     form_class = UserUpdateForm
     template_name = 'users/update.html'
@@ -151,19 +235,24 @@ class UserUpdateView(MyMixin, UpdateView):
 
     def form_valid(self, form):
         super().form_valid(form)
+        log_activity(self.request.user, 'updated', self.object, self.object.organization_id)
         messages.success(self.request, "User is updated successfully!")
         return redirect(reverse_lazy('user_app:list'))
 
-class UserDeleteView(MyMixin, DeleteView):
+class UserDeleteView(MyMixin, TenantMixin, DeleteView):
     model = MyUser
     template_name = 'users/delete.html'
     success_url = reverse_lazy('user_app:list')
 
     def form_valid(self, form):
-        super().form_valid(form)
+        # Logged inside the delete's transaction, before the instance loses its pk.
+        with transaction.atomic():
+            log_activity(self.request.user, 'deleted', self.object, self.object.organization_id)
+            super().form_valid(form)
         messages.warning(self.request, "User is deleted successfully!")
         return redirect(reverse_lazy('user_app:list'))
 
+@method_decorator(csrf_exempt, name='dispatch')
 class UserProfile(LoginRequiredMixin, UpdateView):
     def get(self, request, **kwargs):
         user = request.user
@@ -179,39 +268,42 @@ class UserProfile(LoginRequiredMixin, UpdateView):
         return render(request, 'users/profile.html', context)
 
     def post(self, request, *args, **kwargs):
+        # Upload handlers must be swapped before request.POST is read, so CSRF
+        # is checked here instead of by the middleware.
+        request.upload_handlers = [ProfileImageUploadHandler(request)]
+        return self._post(request, *args, **kwargs)
+
+    @method_decorator(csrf_protect)
+    def _post(self, request, *args, **kwargs):
         user = request.user
         c_form = CustomerUpdateForm(request.POST, instance=user)
         p_form = CustomerProfileForm(request.POST, request.FILES, instance=user.profile)
-        if c_form.is_valid() and p_form.is_valid():
+        for error in request.upload_errors.values():
+            messages.error(request, error)
+        if c_form.is_valid() and p_form.is_valid() and not request.upload_errors:
             username = c_form.cleaned_data['username']
             c_form.save()
             p_form.save()
             messages.success(request, f"{username}'s profile has been updated successfully!")
         return redirect(reverse_lazy('user_app:profile', kwargs={'pk': user.id}))
 
-def login_view(request):
-    if request.method == 'POST':
-        form = CustomLoginForm(request.POST)
-        if form.is_valid():
-            encrypted_password = form.cleaned_data['password']
-            username = form.cleaned_data['username']
-            secret_key = 'your-secret-key'  # Use your actual secret key
+class Echo:
+    """File-like object whose write returns the value, for streaming csv rows."""
+    def write(self, value):
+        return value
 
-            # Decrypt the password
-            try:
-                password = decrypt_password(encrypted_password, secret_key)
-            except Exception as e:
-                # Handle decryption errors
-                return render(request, 'users/login.html', {'form': form, 'error': 'Invalid login credentials.'})
-
-            # Authenticate the user
-            user = authenticate(request, username=username, password=password)
-            if user is not None:
-                login(request, user)
-                return redirect('home')  # Redirect to the home page after login
-            else:
-                # Invalid credentials
-                return render(request, 'users/login.html', {'form': form, 'error': 'Invalid login credentials.'})
-    else:
-        form = CustomLoginForm()
-    return render(request, 'users/login.html', {'form': form})
+class ActivityLogExportView(MyMixin, View):
+    """Streams the tenant's activity log as CSV without loading it into memory."""
+    header = ('created_at', 'actor', 'action', 'target')
+
+    def get(self, request, *args, **kwargs):
+        entries = ActivityLog.objects.for_request(request).order_by('created_at')
+        writer = csv.writer(Echo())
+        rows = (writer.writerow(row) for row in self.rows(entries))
+        response = StreamingHttpResponse(rows, content_type='text/csv')
+        response['Content-Disposition'] = 'attachment; filename="activity_log.csv"'
+        return response
+
+    def rows(self, entries):
+        yield self.header
+        yield from entries.values_list(*self.header).iterator(chunk_size=2000)